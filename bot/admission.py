@@ -0,0 +1,138 @@
+"""
+Admission control and load shedding in front of the download queue.
+
+Keeps an EWMA of how long a job holds a download slot per platform and
+mode, estimates a new job's wait from the work already queued ahead of it,
+and turns jobs away right away instead of letting them wait for minutes:
+- when the estimated wait exceeds MAX_QUEUE_WAIT_SECONDS,
+- for links that recently failed as too large,
+- for platforms whose circuit breaker is open after repeated failures.
+"""
+import math
+import time
+from collections import OrderedDict
+
+from bot.config import (
+    MAX_CONCURRENT_DOWNLOADS,
+    MAX_FILE_SIZE_MB,
+    MAX_QUEUE_WAIT_SECONDS,
+    BREAKER_FAILURES,
+    BREAKER_COOLDOWN_SECONDS,
+)
+from bot.journal import Job
+
+_EWMA_ALPHA = 0.2
+# Assumed slot time for a platform/mode until a job of that kind has finished
+_DEFAULT_JOB_SECONDS = 20.0
+
+# Links that came out too large are refused for a while without downloading
+_TOO_LARGE_TTL = 3600
+_TOO_LARGE_MAX = 1000
+
+_MIN_RETRY_AFTER = 5
+
+
+class JobRejected(Exception):
+    def __init__(self, message: str, retry_after: int | None = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# (platform, audio_only) -> EWMA of seconds a job holds a slot
+_ewma: dict[tuple[str, bool], float] = {}
+# job_id -> (estimated seconds, slot acquired at, or None while still waiting)
+_jobs: dict[str, tuple[float, float | None]] = {}
+# (url, audio_only) -> expires at
+_too_large: OrderedDict[tuple[str, bool], float] = OrderedDict()
+# platform -> consecutive failures / breaker open until
+_failures: dict[str, int] = {}
+_open_until: dict[str, float] = {}
+
+
+def estimate_duration(platform: str, audio_only: bool) -> float:
+    return _ewma.get((platform, audio_only), _DEFAULT_JOB_SECONDS)
+
+
+def estimate_wait() -> float:
+    """Seconds a job admitted now would wait for a slot."""
+    now = time.monotonic()
+    active = [max(0.0, est - (now - started)) for est, started in _jobs.values() if started is not None]
+    waiting = [est for est, started in _jobs.values() if started is None]
+    if len(active) < MAX_CONCURRENT_DOWNLOADS and not waiting:
+        return 0.0
+    return (sum(active) + sum(waiting)) / MAX_CONCURRENT_DOWNLOADS
+
+
+def shed_reason(url: str, platform: str, audio_only: bool) -> JobRejected | None:
+    """Why a job should not run at all right now, or None."""
+    now = time.monotonic()
+    expires = _too_large.get((url, audio_only))
+    if expires is not None and expires > now:
+        return JobRejected(f"This link was already too large for the {MAX_FILE_SIZE_MB} MB limit.")
+
+    until = _open_until.get(platform, 0.0)
+    if until > now:
+        return JobRejected(
+            f"{platform} downloads are failing right now.",
+            retry_after=max(_MIN_RETRY_AFTER, math.ceil(until - now)),
+        )
+    return None
+
+
+def admit(job: Job) -> None:
+    """
+    Raise JobRejected if a new job should be turned away, otherwise count it
+    as queued right away. Checking and reserving happen in one synchronous
+    step, so concurrent callbacks can't all pass against the same queue.
+    """
+    reason = shed_reason(job.url, job.platform, job.audio_only)
+    if reason:
+        raise reason
+
+    if MAX_QUEUE_WAIT_SECONDS > 0:
+        wait = estimate_wait()
+        if wait > MAX_QUEUE_WAIT_SECONDS:
+            raise JobRejected(
+                f"The queue is full (about {math.ceil(wait)}s wait).",
+                retry_after=max(_MIN_RETRY_AFTER, math.ceil(wait - MAX_QUEUE_WAIT_SECONDS)),
+            )
+    enqueued(job)
+
+
+def enqueued(job: Job) -> None:
+    """Count a job as queued (no-op if admit() already did)."""
+    _jobs.setdefault(job.job_id, (estimate_duration(job.platform, job.audio_only), None))
+
+
+def started(job: Job) -> None:
+    est, _ = _jobs.get(job.job_id, (estimate_duration(job.platform, job.audio_only), None))
+    _jobs[job.job_id] = (est, time.monotonic())
+
+
+def finished(job: Job, outcome: str | None, slot_seconds: float | None) -> None:
+    """Forget a job and learn from how it went."""
+    _jobs.pop(job.job_id, None)
+    now = time.monotonic()
+
+    if slot_seconds is not None:
+        key = (job.platform, job.audio_only)
+        prev = _ewma.get(key)
+        _ewma[key] = slot_seconds if prev is None else prev + _EWMA_ALPHA * (slot_seconds - prev)
+
+    if outcome == "ok":
+        _failures.pop(job.platform, None)
+        _open_until.pop(job.platform, None)
+    elif outcome == "platform error":
+        # Only failures the platform caused. Bad links ("failed") and our own upload or
+        # disk errors ("error") say nothing about the platform, so they don't count.
+        # After the cooldown the count stays at the threshold, so one more failure
+        # reopens the breaker.
+        _failures[job.platform] = _failures.get(job.platform, 0) + 1
+        if _failures[job.platform] >= BREAKER_FAILURES:
+            _open_until[job.platform] = now + BREAKER_COOLDOWN_SECONDS
+    elif outcome == "too large":
+        key = (job.url, job.audio_only)
+        _too_large[key] = now + _TOO_LARGE_TTL
+        _too_large.move_to_end(key)
+        while len(_too_large) > _TOO_LARGE_MAX:
+            _too_large.popitem(last=False)
@@ -0,0 +1,146 @@
+"""
+Fit-to-limit re-encoding for downloads over MAX_FILE_SIZE_BYTES.
+
+The target bitrate is computed up front from the duration and the size
+budget, so a single ffmpeg pass lands under the limit without trial and
+error. Re-encodes run on a small dedicated pool, and together they use at
+most all cores but one, leaving room for yt-dlp's own ffmpeg merges and
+the event loop.
+"""
+import asyncio
+import logging
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from bot.config import MAX_FILE_SIZE_BYTES, REENCODE_TIMEOUT, REENCODE_WORKERS
+from bot.downloader import FileTooLargeError, cleanup_file
+
+logger = logging.getLogger(__name__)
+
+# Headroom for container overhead and encoder overshoot
+_SIZE_MARGIN = 0.92
+
+_AUDIO_KBPS = 128
+_LOW_AUDIO_KBPS = 64
+_MAX_MP3_KBPS = 192
+_MIN_AUDIO_KBPS = 32
+_MIN_VIDEO_KBPS = 150
+
+# (minimum video kbps, max output height) — lower bitrates get smaller frames
+_RESOLUTION_LADDER = [(2500, 1080), (1200, 720), (600, 480), (0, 360)]
+
+_pool = ThreadPoolExecutor(max_workers=REENCODE_WORKERS, thread_name_prefix="reencode")
+# One core is kept free for downloads/merges and the event loop
+_threads_per_job = max(1, ((os.cpu_count() or 1) - 1) // REENCODE_WORKERS)
+
+
+def _limit_mb() -> int:
+    return MAX_FILE_SIZE_BYTES // (1024 * 1024)
+
+
+def plan_bitrates(duration: float, audio_only: bool) -> tuple[int, int]:
+    """
+    Split the size budget into (video_kbps, audio_kbps) for a given duration.
+    Raises FileTooLargeError if the result would be unwatchable.
+    """
+    budget_kbps = int(MAX_FILE_SIZE_BYTES * 8 * _SIZE_MARGIN / duration / 1000)
+
+    if audio_only:
+        if budget_kbps < _MIN_AUDIO_KBPS:
+            raise FileTooLargeError(
+                f"Audio is too long to fit in {_limit_mb()} MB at a listenable quality."
+            )
+        return 0, min(budget_kbps, _MAX_MP3_KBPS)
+
+    audio_kbps = _AUDIO_KBPS if budget_kbps >= 1000 else _LOW_AUDIO_KBPS
+    video_kbps = budget_kbps - audio_kbps
+    if video_kbps < _MIN_VIDEO_KBPS:
+        raise FileTooLargeError(
+            f"Video is too long to fit in {_limit_mb()} MB at a watchable quality."
+        )
+    return video_kbps, audio_kbps
+
+
+def target_height(video_kbps: int, source_height: int | None) -> int:
+    """Pick the output height for a bitrate, never upscaling the source."""
+    height = next(h for min_kbps, h in _RESOLUTION_LADDER if video_kbps >= min_kbps)
+    if source_height:
+        height = min(height, source_height)
+    return height
+
+
+def _ffmpeg_args(src: Path, dst: Path, video_kbps: int, audio_kbps: int, height: int, audio_only: bool) -> list[str]:
+    args = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", str(src)]
+    if audio_only:
+        args += ["-vn", "-c:a", "libmp3lame", "-b:a", f"{audio_kbps}k"]
+    else:
+        args += [
+            "-vf", f"scale=-2:min(ih\\,{height})",
+            "-c:v", "libx264", "-preset", "veryfast",
+            "-b:v", f"{video_kbps}k",
+            "-maxrate", f"{video_kbps}k",
+            "-bufsize", f"{video_kbps * 2}k",
+            "-c:a", "aac", "-b:a", f"{audio_kbps}k",
+            "-movflags", "+faststart",
+        ]
+    args += ["-threads", str(_threads_per_job), str(dst)]
+    return args
+
+
+def fit_to_limit(result: dict[str, Any]) -> dict[str, Any]:
+    """
+    Sync re-encode of an oversized download so it fits MAX_FILE_SIZE_BYTES.
+    Returns an updated copy of the download result; the source file is removed.
+    """
+    src = Path(result["file_path"])
+    audio_only = result.get("audio_only", False)
+    duration = float(result.get("duration") or 0)
+
+    try:
+        if duration <= 0:
+            raise FileTooLargeError("File is too large and its duration is unknown, so it can't be compressed.")
+        video_kbps, audio_kbps = plan_bitrates(duration, audio_only)
+    except FileTooLargeError:
+        cleanup_file(str(src))
+        raise
+
+    height = 0 if audio_only else target_height(video_kbps, result.get("height"))
+    dst = src.with_name(f"{src.stem}_fit.{'mp3' if audio_only else 'mp4'}")
+    args = _ffmpeg_args(src, dst, video_kbps, audio_kbps, height, audio_only)
+
+    logger.info(f"Re-encoding {src.name} to fit: video={video_kbps}k audio={audio_kbps}k height={height}")
+    try:
+        proc = subprocess.run(args, capture_output=True, text=True, timeout=REENCODE_TIMEOUT)
+        if proc.returncode != 0:
+            logger.error(f"ffmpeg failed for {src.name}: {proc.stderr.strip()[-500:]}")
+            raise FileTooLargeError("File is too large and compressing it failed.")
+        if dst.stat().st_size > MAX_FILE_SIZE_BYTES:
+            raise FileTooLargeError(f"File is still over {_limit_mb()} MB after compression.")
+    except subprocess.TimeoutExpired:
+        cleanup_file(str(dst))
+        raise FileTooLargeError("File is too large and compressing it took too long.")
+    except (FileTooLargeError, OSError) as e:
+        cleanup_file(str(dst))
+        if isinstance(e, FileTooLargeError):
+            raise
+        raise FileTooLargeError(f"File is too large and could not be compressed: {e}") from e
+    finally:
+        cleanup_file(str(src))
+
+    if audio_only:
+        quality = f"{audio_kbps} kbps MP3"
+    else:
+        quality = f"{height}p @ {video_kbps / 1000:.1f} Mbps"
+
+    return {**result, "file_path": str(dst), "needs_fit": False, "fit_quality": quality}
+
+
+async def fit_to_limit_async(result: dict[str, Any]) -> dict[str, Any]:
+    """
+    Async wrapper running fit_to_limit on the bounded re-encode pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, fit_to_limit, result)
@@ -20,12 +20,40 @@ MAX_FILE_SIZE_BYTES: int = MAX_FILE_SIZE_MB * 1024 * 1024
 DOWNLOAD_DIR: Path = Path(os.getenv("DOWNLOAD_DIR", "./downloads"))
 DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+# Write-ahead job journal used to resume interrupted downloads after a restart
+JOURNAL_PATH: Path = Path(os.getenv("JOURNAL_PATH", str(DOWNLOAD_DIR / "jobs.journal")))
+# Give up on a job after it has been resumed this many times (avoids crash loops)
+JOURNAL_MAX_RESUMES: int = int(os.getenv("JOURNAL_MAX_RESUMES", "2"))
+
+# Opt-in: re-encode oversized downloads to fit MAX_FILE_SIZE_MB instead of rejecting them
+FIT_TO_LIMIT: bool = os.getenv("FIT_TO_LIMIT", "false").lower() in ("1", "true", "yes")
+# Max simultaneous re-encodes (each one is CPU-heavy) and per-job time limit (seconds)
+REENCODE_WORKERS: int = max(1, int(os.getenv("REENCODE_WORKERS", "1")))
+REENCODE_TIMEOUT: int = int(os.getenv("REENCODE_TIMEOUT", "600"))
+
 # Cooldown between requests per user (seconds)
 COOLDOWN_SECONDS: int = int(os.getenv("COOLDOWN_SECONDS", "5"))
 
 # Max simultaneous downloads across all users
 MAX_CONCURRENT_DOWNLOADS: int = int(os.getenv("MAX_CONCURRENT_DOWNLOADS", "3"))
 
+# Log the event loop's stack when it is blocked for longer than this (milliseconds)
+LOOP_LAG_THRESHOLD_MS: int = int(os.getenv("LOOP_LAG_THRESHOLD_MS", "250"))
+
+# Admission control: reject new jobs whose estimated queue wait exceeds this (seconds, 0 disables)
+MAX_QUEUE_WAIT_SECONDS: int = int(os.getenv("MAX_QUEUE_WAIT_SECONDS", "120"))
+# Stop accepting a platform's links for a while after this many consecutive download failures
+BREAKER_FAILURES: int = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_SECONDS: int = int(os.getenv("BREAKER_COOLDOWN_SECONDS", "120"))
+
+# --- Transport Settings ---
+# How long resolved CDN addresses are reused before asking DNS again (seconds, 0 disables)
+DNS_CACHE_TTL: int = int(os.getenv("DNS_CACHE_TTL", "300"))
+
+# Keep-alive pool shared by all yt-dlp jobs: distinct hosts kept, idle connections per host
+HTTP_POOL_HOSTS: int = int(os.getenv("HTTP_POOL_HOSTS", "32"))
+HTTP_POOL_SIZE: int = int(os.getenv("HTTP_POOL_SIZE", "8"))
+
 # --- Supported Platforms ---
 SUPPORTED_PLATFORMS: dict[str, list[str]] = {
     "TikTok":      ["tiktok.com", "vm.tiktok.com", "vt.tiktok.com"],
@@ -6,8 +6,9 @@ from typing import Any, Callable
 
 import yt_dlp
 
-from bot.config import DOWNLOAD_DIR, MAX_FILE_SIZE_BYTES
+from bot.config import DOWNLOAD_DIR, MAX_FILE_SIZE_BYTES, FIT_TO_LIMIT
 from bot.utils import sanitize_filename
+from bot.transport import downloader_scope
 
 logger = logging.getLogger(__name__)
 
@@ -16,10 +17,36 @@ class DownloadError(Exception):
     pass
 
 
+class PlatformError(DownloadError):
+    """The platform itself failed (blocked, rate-limited, extractor broken), not the link."""
+    pass
+
+
 class FileTooLargeError(Exception):
     pass
 
 
+# yt-dlp messages that point at the link rather than the platform (private, deleted, ...)
+_LINK_ERROR_MARKERS = (
+    "private",
+    "unavailable",
+    "not available",
+    "removed",
+    "deleted",
+    "does not exist",
+    "not found",
+    "404",
+    "unsupported url",
+    "no video",
+    "login",
+    "log in",
+    "sign in",
+    "age-restricted",
+    "confirm your age",
+    "copyright",
+)
+
+
 def _get_ydl_opts(
     output_path: str,
     audio_only: bool = False,
@@ -73,29 +100,32 @@ async def download_video_async(
     url: str,
     audio_only: bool = False,
     progress_hook: Callable[[dict[str, Any]], None] | None = None,
+    file_id: str | None = None,
 ) -> dict[str, Any]:
     """
     Async wrapper for download_video using asyncio.to_thread.
     """
-    return await asyncio.to_thread(download_video, url, audio_only, progress_hook)
+    return await asyncio.to_thread(download_video, url, audio_only, progress_hook, file_id)
 
 
 def download_video(
     url: str,
     audio_only: bool = False,
     progress_hook: Callable[[dict[str, Any]], None] | None = None,
+    file_id: str | None = None,
 ) -> dict[str, Any]:
     """
     Sync download logic (run in thread to avoid blocking loop).
+    Passing the same file_id again resumes from any leftover .part file.
     """
-    file_id = uuid.uuid4().hex[:12]
+    file_id = file_id or uuid.uuid4().hex[:12]
     # Use placeholder for yt-dlp to fill extension
     output_template = str(DOWNLOAD_DIR / f"{file_id}.%(ext)s")
 
     opts = _get_ydl_opts(output_template, audio_only, progress_hook)
 
     try:
-        with yt_dlp.YoutubeDL(opts) as ydl:
+        with downloader_scope(), yt_dlp.YoutubeDL(opts) as ydl:
             # Extract info first
             info = ydl.extract_info(url, download=True)
 
@@ -121,9 +151,12 @@ def download_video(
             if not Path(file_path).exists():
                 raise DownloadError("Download finished but file not found.")
 
-            # Check file size
+            # Check file size — oversized files are kept for re-encoding if FIT_TO_LIMIT is on
             file_size = Path(file_path).stat().st_size
-            if file_size > MAX_FILE_SIZE_BYTES:
+            needs_fit = False
+            if file_size > MAX_FILE_SIZE_BYTES and FIT_TO_LIMIT and info.get("duration"):
+                needs_fit = True
+            elif file_size > MAX_FILE_SIZE_BYTES:
                 Path(file_path).unlink(missing_ok=True)
                 size_mb = file_size / (1024 * 1024)
                 limit_mb = MAX_FILE_SIZE_BYTES // (1024 * 1024)
@@ -138,14 +171,19 @@ def download_video(
                 "platform": info.get("extractor_key", "unknown"),
                 "uploader": info.get("uploader", "Unknown"),
                 "thumbnail": info.get("thumbnail"),
+                "height": info.get("height"),
                 "audio_only": audio_only,
+                "needs_fit": needs_fit,
             }
 
     except FileTooLargeError:
         raise
     except yt_dlp.utils.DownloadError as e:
         logger.error(f"yt-dlp error: {e}")
-        raise DownloadError(f"Platform error: {str(e).split(';')[0]}") from e
+        message = f"Platform error: {str(e).split(';')[0]}"
+        if any(marker in str(e).lower() for marker in _LINK_ERROR_MARKERS):
+            raise DownloadError(message) from e
+        raise PlatformError(message) from e
     except Exception as e:
         logger.exception("Unexpected downloader error")
         raise DownloadError(f"Technical error: {e}") from e
@@ -164,3 +202,12 @@ def cleanup_file(file_path: str | None) -> None:
                 sidecar.unlink(missing_ok=True)
     except OSError as e:
         logger.warning(f"Failed to clean up {file_path}: {e}")
+
+
+def cleanup_job_files(file_id: str) -> None:
+    """Remove everything a job left in DOWNLOAD_DIR, including .part files."""
+    for f in DOWNLOAD_DIR.glob(f"{file_id}*"):
+        try:
+            f.unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"Failed to clean up {f}: {e}")
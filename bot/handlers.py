@@ -1,10 +1,12 @@
 import logging
 import asyncio
+import time
 import uuid
 from pathlib import Path
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ChatAction, ParseMode
+from telegram.error import BadRequest
 from telegram.ext import (
     ContextTypes,
     CommandHandler,
@@ -13,16 +15,24 @@ from telegram.ext import (
     filters,
 )
 
-from bot.config import SUPPORTED_PLATFORMS, ADMIN_IDS, COOLDOWN_SECONDS
+from bot.config import SUPPORTED_PLATFORMS, ADMIN_IDS, COOLDOWN_SECONDS, MAX_FILE_SIZE_MB
+from bot import profiler
 from bot.downloader import (
     download_video_async, 
     cleanup_file, 
+    cleanup_job_files,
     DownloadError, 
+    PlatformError,
     FileTooLargeError
 )
+from bot.compressor import fit_to_limit_async
 from bot.utils import extract_urls, identify_platform, format_file_size, get_file_size, _escape_html
-from bot.stats import stats
+from bot.stats import stats, StageTimer
+from bot.loop_monitor import loop_monitor
+from bot.journal import journal, Job, DOWNLOADING, POST_PROCESSING, UPLOADING, DONE, FAILED
 from bot import queue_manager
+from bot import admission
+from bot.admission import JobRejected
 
 logger = logging.getLogger(__name__)
 
@@ -96,7 +106,9 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     text = (
         "🛰 <b>Bot Status</b>\n\n"
         f"Active downloads: <b>{active}</b>\n"
-        f"Global queue depth: <b>{depth}</b>\n\n"
+        f"Global queue depth: <b>{depth}</b>\n"
+        f"Estimated wait: <b>{admission.estimate_wait():.0f}s</b>\n"
+        f"Event loop lag (p99): <b>{loop_monitor.percentile(99) * 1000:.0f} ms</b>\n\n"
         "✅ The bot is running normally."
     )
     await update.message.reply_text(text, parse_mode=ParseMode.HTML)
@@ -107,7 +119,63 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     if update.effective_user.id not in ADMIN_IDS:
         await update.message.reply_text("🔒 This command is restricted to admins.")
         return
-    await update.message.reply_text(stats.summary_text(), parse_mode=ParseMode.HTML)
+    text = stats.summary_text() + (
+        f"\n\n🐢 Event loop: p99 lag <b>{loop_monitor.percentile(99) * 1000:.0f} ms</b>, "
+        f"<b>{loop_monitor.stalls}</b> stall(s) logged"
+    )
+    await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle /profile [seconds] — admin-only sampling profile of all threads."""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("🔒 This command is restricted to admins.")
+        return
+
+    seconds = 30
+    if context.args:
+        if not context.args[0].isdigit():
+            await update.message.reply_text("Usage: /profile [seconds]")
+            return
+        seconds = max(1, min(int(context.args[0]), profiler.MAX_SECONDS))
+
+    status = await update.message.reply_text(f"🔬 Profiling all threads for {seconds}s...")
+    try:
+        data, samples = await asyncio.to_thread(profiler.profile, seconds)
+    except profiler.ProfilerBusyError as e:
+        await status.edit_text(f"⚠️ {e}")
+        return
+
+    await update.message.reply_document(
+        document=data,
+        filename=f"profile-{int(time.time())}.collapsed",
+        caption=f"🔬 {samples} samples over {seconds}s (collapsed stacks for speedscope / flamegraph.pl)",
+    )
+    await status.delete()
+
+
+async def timings_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle /timings <platform> [count] — admin-only stage timings of recent jobs."""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("🔒 This command is restricted to admins.")
+        return
+
+    args = list(context.args or [])
+    count = 10
+    if args and args[-1].isdigit():
+        count = max(1, min(int(args.pop()), 50))
+    name = " ".join(args).lower()
+
+    platform = next((p for p in SUPPORTED_PLATFORMS if p.lower() == name), None)
+    platform = platform or next((p for p in SUPPORTED_PLATFORMS if name and name in p.lower()), None)
+    if not platform:
+        platforms = ", ".join(SUPPORTED_PLATFORMS.keys())
+        await update.message.reply_text(
+            f"Usage: /timings &lt;platform&gt; [count]\n<i>{platforms}</i>", parse_mode=ParseMode.HTML
+        )
+        return
+
+    await update.message.reply_text(stats.timings_text(platform, count), parse_mode=ParseMode.HTML)
 
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -157,53 +225,76 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
 
 
-async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle format choice selection."""
-    query = update.callback_query
-    await query.answer()
-    
-    data = query.data.split("|")
-    if data[0] != "dl" or len(data) != 3:
-        return
+def _rejection_text(title: str, e: JobRejected) -> str:
+    text = f"🚦 <b>{title}</b>\n\n{e}"
+    if e.retry_after:
+        text += f"\n\n<i>Please try again in about {e.retry_after}s.</i>"
+    return text
 
-    mode = data[1]  # 'v' or 'a'
-    short_id = data[2]
-    user_id = update.effective_user.id
-    audio_only = (mode == 'a')
 
-    # Retrieve the stored URL
-    url = _pop_url(short_id)
-    if not url:
-        await query.edit_message_text("⚠️ This link has expired. Please send it again.")
-        return
-    
-    platform = identify_platform(url) or "Unknown"
-    
-    # Update message to show "waiting in queue"
-    await query.edit_message_text(
-        f"⏳ Processing <b>{platform}</b>...\n"
-        f"Format: {'🎵 Audio' if audio_only else '🎬 Video'}\n"
-        "<i>Waiting for a download slot...</i>",
-        parse_mode=ParseMode.HTML
-    )
+async def _set_status(bot: Bot, job: Job, text: str) -> None:
+    """Edit the job's status message; a vanished or unchanged message is not an error."""
+    try:
+        await bot.edit_message_text(
+            text, chat_id=job.chat_id, message_id=job.message_id, parse_mode=ParseMode.HTML
+        )
+    except BadRequest as e:
+        logger.debug(f"Could not update status for job {job.job_id}: {e}")
+
+
+async def _delete_status(bot: Bot, job: Job) -> None:
+    try:
+        await bot.delete_message(chat_id=job.chat_id, message_id=job.message_id)
+    except BadRequest as e:
+        logger.debug(f"Could not delete status for job {job.job_id}: {e}")
+
+
+async def _run_job(bot: Bot, job: Job) -> None:
+    """Download, post-process and upload one job, journaling each stage."""
+    platform = job.platform
+    audio_only = job.audio_only
+    url = job.url
 
     acquired = False
+    failed = False
+    outcome: str | None = None
+    timer = StageTimer("queue")
+    admission.enqueued(job)
     try:
         # Acquire slot in queue
-        await queue_manager.acquire(user_id)
+        await queue_manager.acquire(job.user_id)
         acquired = True
+        timer.enter("download")
+        admission.started(job)
+
+        # Things may have changed while we waited (breaker opened, same link too large)
+        reason = admission.shed_reason(url, platform, audio_only)
+        if reason:
+            raise reason
         
+        await journal.transition(job, DOWNLOADING)
         stats.record_attempt()
-        await query.edit_message_text(f"📥 Downloading from <b>{platform}</b>...", parse_mode=ParseMode.HTML)
+        await _set_status(bot, job, f"📥 Downloading from <b>{platform}</b>...")
         
         # Action feedback
         action = ChatAction.UPLOAD_DOCUMENT if audio_only else ChatAction.UPLOAD_VIDEO
-        await query.message.chat.send_action(action)
+        await bot.send_chat_action(job.chat_id, action)
         
-        # Download
+        # Download (same file_id on resume, so yt-dlp continues the .part file)
         logger.info(f"Starting download: {url} (audio_only={audio_only})")
-        result = await download_video_async(url, audio_only=audio_only)
+        result = await download_video_async(url, audio_only=audio_only, file_id=job.file_id)
         logger.info(f"Download complete: {result['file_path']}")
+        timer.enter("post-process")
+        await journal.transition(job, POST_PROCESSING)
+
+        # Over the limit with FIT_TO_LIMIT on: re-encode to a size known in advance
+        if result.get("needs_fit"):
+            await _set_status(bot, job, "🗜 File is over the limit, compressing to fit...")
+            result = await fit_to_limit_async(result)
+            stats.record_fitted()
+            logger.info(f"Compressed to fit: {result['file_path']} ({result['fit_quality']})")
+        
+        timer.enter("upload")
         
         file_path = result["file_path"]
         title = result["title"]
@@ -221,57 +312,189 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             mins, secs = divmod(int(duration), 60)
             caption += f"  ⏱ {mins}:{secs:02d}"
         
-        file_size = get_file_size(file_path)
+        file_size = await asyncio.to_thread(get_file_size, file_path)
         caption += f"\n📦 {format_file_size(file_size)}"
+        if result.get("fit_quality"):
+            caption += f"\n🗜 Compressed to {result['fit_quality']} to fit the {MAX_FILE_SIZE_MB} MB limit"
 
         # Upload
-        await query.edit_message_text("📤 Uploading...")
-        await query.message.chat.send_action(action)
+        await journal.transition(job, UPLOADING)
+        await _set_status(bot, job, "📤 Uploading...")
+        await bot.send_chat_action(job.chat_id, action)
         
         logger.info(f"Uploading {file_path} ({format_file_size(file_size)})")
-        with open(file_path, "rb") as f:
-            if audio_only:
-                await query.message.reply_audio(
-                    audio=f,
-                    caption=caption,
-                    title=title,
-                    performer=uploader,
-                    duration=int(duration),
-                    parse_mode=ParseMode.HTML,
-                    read_timeout=120,
-                    write_timeout=120,
-                )
-            else:
-                await query.message.reply_video(
-                    video=f,
-                    caption=caption,
-                    duration=int(duration),
-                    parse_mode=ParseMode.HTML,
-                    supports_streaming=True,
-                    read_timeout=120,
-                    write_timeout=120,
-                )
+        # Read in a worker thread; handing PTB a file object would read it on the loop
+        data = await asyncio.to_thread(Path(file_path).read_bytes)
+        filename = Path(file_path).name
+        if audio_only:
+            await bot.send_audio(
+                chat_id=job.chat_id,
+                audio=data,
+                filename=filename,
+                caption=caption,
+                title=title,
+                performer=uploader,
+                duration=int(duration),
+                parse_mode=ParseMode.HTML,
+                read_timeout=120,
+                write_timeout=120,
+            )
+        else:
+            await bot.send_video(
+                chat_id=job.chat_id,
+                video=data,
+                filename=filename,
+                caption=caption,
+                duration=int(duration),
+                parse_mode=ParseMode.HTML,
+                supports_streaming=True,
+                read_timeout=120,
+                write_timeout=120,
+            )
+        
+        timer.enter("cleanup")
         
         # Cleanup and stats
-        cleanup_file(file_path)
-        stats.record_success(platform, user_id)
-        await query.delete_message()
-        logger.info(f"Successfully sent to user {user_id}")
-
+        await asyncio.to_thread(cleanup_file, file_path)
+        outcome = "ok"
+        stats.record_success(platform, job.user_id)
+        await journal.transition(job, DONE)
+        await _delete_status(bot, job)
+        logger.info(f"Successfully sent to user {job.user_id}")
+
+    except JobRejected as e:
+        timer.enter("cleanup")
+        failed = True
+        outcome = "shed"
+        stats.record_rejected()
+        # The link was already taken from _pending_urls and the buttons are gone,
+        # so the only way to retry is to send the link again
+        text = f"🚦 <b>Dropped from queue</b>\n\n{e}"
+        if e.retry_after:
+            text += f"\n\n<i>Please send the link again in about {e.retry_after}s.</i>"
+        await _set_status(bot, job, text)
     except FileTooLargeError as e:
+        timer.enter("cleanup")
+        failed = True
+        outcome = "too large"
         stats.record_too_large()
-        await query.edit_message_text(f"❌ <b>Too Large</b>\n\n{e}", parse_mode=ParseMode.HTML)
+        await _set_status(bot, job, f"❌ <b>Too Large</b>\n\n{e}")
     except DownloadError as e:
+        timer.enter("cleanup")
+        failed = True
+        # Only platform-side failures feed the breaker; a private or deleted link doesn't
+        outcome = "platform error" if isinstance(e, PlatformError) else "failed"
         stats.record_failure()
         logger.error(f"Download error for {url}: {e}")
-        await query.edit_message_text(f"❌ <b>Download Failed</b>\n\n{e}", parse_mode=ParseMode.HTML)
+        await _set_status(bot, job, f"❌ <b>Download Failed</b>\n\n{e}")
     except Exception as e:
-        logger.exception(f"Unexpected error in callback for {url}")
+        timer.enter("cleanup")
+        failed = True
+        outcome = "error"
+        logger.exception(f"Unexpected error in job for {url}")
         stats.record_failure()
-        await query.edit_message_text("❌ <b>An unexpected error occurred.</b>", parse_mode=ParseMode.HTML)
+        await _set_status(bot, job, "❌ <b>An unexpected error occurred.</b>")
     finally:
-        if acquired:
-            await queue_manager.release(user_id)
+        try:
+            # A cancelled job (shutdown) is deliberately left unfinished in the journal
+            if failed:
+                await asyncio.to_thread(cleanup_job_files, job.file_id)
+                await journal.transition(job, FAILED)
+        finally:
+            # Whatever happened above, the slot and the admission entry must be given back
+            slot_seconds = None
+            if outcome:
+                timer.enter(None)
+                stats.record_job(platform, audio_only, outcome, timer.stages)
+                if outcome != "shed":
+                    slot_seconds = sum(timer.stages.values()) - timer.stages.get("queue", 0.0)
+            admission.finished(job, outcome, slot_seconds)
+            if acquired:
+                await queue_manager.release(job.user_id)
+
+
+async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle format choice selection."""
+    query = update.callback_query
+    await query.answer()
+    
+    data = query.data.split("|")
+    if data[0] != "dl" or len(data) != 3:
+        return
+
+    mode = data[1]  # 'v' or 'a'
+    short_id = data[2]
+    user_id = update.effective_user.id
+    audio_only = (mode == 'a')
+
+    # Retrieve the stored URL
+    url = _pop_url(short_id)
+    if not url:
+        await query.edit_message_text("⚠️ This link has expired. Please send it again.")
+        return
+    
+    platform = identify_platform(url) or "Unknown"
+
+    job = Job(
+        url=url,
+        audio_only=audio_only,
+        platform=platform,
+        user_id=user_id,
+        chat_id=query.message.chat_id,
+        message_id=query.message.message_id,
+    )
+
+    # Turn the job away now rather than have it sit in the queue for minutes
+    try:
+        admission.admit(job)
+    except JobRejected as e:
+        stats.record_rejected()
+        logger.info(f"Rejected {url}: {e}")
+        reply_markup = None
+        if e.retry_after:
+            # Keep the buttons working so the user can simply retry later
+            _pending_urls[short_id] = url
+            reply_markup = query.message.reply_markup
+        await query.edit_message_text(
+            _rejection_text("Not queued", e), parse_mode=ParseMode.HTML, reply_markup=reply_markup
+        )
+        return
+
+    try:
+        # Journal the job before anything else, so a restart from here on can replay it
+        await journal.start(job)
+        
+        # Update message to show "waiting in queue"
+        await query.edit_message_text(
+            f"⏳ Processing <b>{platform}</b>...\n"
+            f"Format: {'🎵 Audio' if audio_only else '🎬 Video'}\n"
+            "<i>Waiting for a download slot...</i>",
+            parse_mode=ParseMode.HTML
+        )
+    except BaseException:
+        # The job never reached _run_job, so give its admission reservation back
+        admission.finished(job, None, None)
+        raise
+
+    await _run_job(context.bot, job)
+
+
+async def resume_job(bot: Bot, job: Job) -> None:
+    """Pick up a job left unfinished by a previous run."""
+    logger.info(f"Resuming job {job.job_id} ({job.state}): {job.url}")
+    await _set_status(
+        bot, job,
+        f"♻️ Resuming <b>{job.platform}</b> download after a restart...\n"
+        "<i>Waiting for a download slot...</i>",
+    )
+    await _run_job(bot, job)
+
+
+async def abandon_job(bot: Bot, job: Job) -> None:
+    """Give up on a job that keeps getting interrupted."""
+    logger.warning(f"Abandoning job {job.job_id} after {job.resumes} resume(s): {job.url}")
+    await asyncio.to_thread(cleanup_job_files, job.file_id)
+    await _set_status(bot, job, "❌ <b>This download could not be finished.</b>\n\nPlease send the link again.")
 
 
 # ─────────────────────── Handler Registration ────────────────────
@@ -284,6 +507,11 @@ def get_handlers() -> list:
         CommandHandler("help", help_command),
         CommandHandler("status", status_command),
         CommandHandler("stats", stats_command),
+        # Non-blocking so the sample window overlaps the jobs it is meant to observe
+        CommandHandler("profile", profile_command, block=False),
+        CommandHandler("timings", timings_command),
         MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message),
-        CallbackQueryHandler(handle_callback),
+        # Non-blocking: jobs must wait on queue_manager.acquire, where admission
+        # can see them, rather than in PTB's serial update queue
+        CallbackQueryHandler(handle_callback, block=False),
     ]
@@ -0,0 +1,166 @@
+"""
+Write-ahead journal of download jobs, so accepted work survives a restart.
+
+Every state change is appended as one JSON line and fsynced before the job
+moves on; every few hundred finished jobs the file is rewritten down to the
+jobs still in flight, so it stays small on a long-running bot. On startup the journal is replayed: jobs that never reached a
+final state are handed back to the handlers, and since a job always
+downloads under its own job_id, yt-dlp continues from the .part file left
+behind instead of starting from byte zero.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from threading import Lock
+
+from bot.config import JOURNAL_PATH, JOURNAL_MAX_RESUMES
+
+logger = logging.getLogger(__name__)
+
+# Job states, in the order a job normally goes through them
+QUEUED = "queued"
+DOWNLOADING = "downloading"
+POST_PROCESSING = "post-processing"
+UPLOADING = "uploading"
+DONE = "done"
+FAILED = "failed"
+
+_FINAL_STATES = {DONE, FAILED}
+
+# Rewrite the journal down to live jobs after this many jobs have finished
+_COMPACT_EVERY = 200
+
+
+@dataclass
+class Job:
+    url: str
+    audio_only: bool
+    platform: str
+    user_id: int
+    chat_id: int
+    # Status message that gets edited while the job runs
+    message_id: int
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    state: str = QUEUED
+    resumes: int = 0
+
+    @property
+    def file_id(self) -> str:
+        """Stable download file name, so a resumed job finds its .part file."""
+        return self.job_id
+
+
+_JOB_FIELDS = {f.name for f in fields(Job)}
+
+
+class JobJournal:
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._lock = Lock()
+        # job_id -> latest full record of every job not yet in a final state
+        self._live: dict[str, dict] = {}
+        self._finished_since_compact = 0
+
+    def _rewrite(self, records) -> None:
+        # Atomic replace, so a crash mid-rewrite leaves the old journal intact
+        tmp = self._path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path)
+
+    def _append(self, entry: dict) -> None:
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        job_id = entry.get("job_id")
+        with self._lock:
+            if "url" in entry:
+                self._live[job_id] = dict(entry)
+            elif job_id in self._live:
+                self._live[job_id]["state"] = entry["state"]
+            if entry.get("state") in _FINAL_STATES:
+                self._live.pop(job_id, None)
+                self._finished_since_compact += 1
+
+            # Finished jobs are dead weight; rewriting to the live set also records this entry
+            if self._finished_since_compact >= _COMPACT_EVERY:
+                try:
+                    self._rewrite(self._live.values())
+                    self._finished_since_compact = 0
+                    return
+                except OSError as e:
+                    logger.warning(f"Journal compaction failed, appending instead: {e}")
+
+            with open(self._path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    async def _write(self, entry: dict) -> None:
+        # Best-effort: a full disk costs us crash recovery, not the job itself
+        try:
+            await asyncio.to_thread(self._append, entry)
+        except OSError as e:
+            logger.warning(f"Journal write failed for job {entry.get('job_id')}: {e}")
+
+    async def start(self, job: Job) -> None:
+        """Record a newly accepted job with everything needed to replay it."""
+        job.state = QUEUED
+        await self._write({"ts": time.time(), **asdict(job)})
+
+    async def transition(self, job: Job, state: str) -> None:
+        job.state = state
+        await self._write({"ts": time.time(), "job_id": job.job_id, "state": state})
+
+    def recover(self) -> tuple[list[Job], list[Job]]:
+        """
+        Replay the journal at startup and compact it down to unfinished jobs.
+        Returns (resumable, abandoned); abandoned jobs hit JOURNAL_MAX_RESUMES.
+        """
+        try:
+            lines = self._path.read_text(encoding="utf-8").splitlines()
+        except FileNotFoundError:
+            return [], []
+
+        jobs: dict[str, Job] = {}
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Torn last line from a crash mid-write
+                continue
+            job_id = entry.get("job_id")
+            if "url" in entry:
+                jobs[job_id] = Job(**{k: v for k, v in entry.items() if k in _JOB_FIELDS})
+            elif job_id in jobs:
+                jobs[job_id].state = entry.get("state", jobs[job_id].state)
+
+        resumable: list[Job] = []
+        abandoned: list[Job] = []
+        for job in jobs.values():
+            if job.state in _FINAL_STATES:
+                continue
+            if job.resumes >= JOURNAL_MAX_RESUMES:
+                abandoned.append(job)
+            else:
+                job.resumes += 1
+                resumable.append(job)
+
+        with self._lock:
+            self._live = {job.job_id: {"ts": time.time(), **asdict(job)} for job in resumable}
+            self._finished_since_compact = 0
+            self._rewrite(self._live.values())
+
+        if resumable or abandoned:
+            logger.info(f"Journal: {len(resumable)} job(s) to resume, {len(abandoned)} abandoned.")
+        return resumable, abandoned
+
+
+# Singleton instance shared across the bot
+journal = JobJournal(JOURNAL_PATH)
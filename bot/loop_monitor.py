@@ -0,0 +1,84 @@
+"""
+Event-loop lag monitor.
+
+A coroutine sleeps for a fixed interval and records how late it wakes up;
+the overshoot is time the loop spent stuck in something else. A watchdog
+thread watches the same heartbeat and, once the loop stalls for longer
+than LOOP_LAG_THRESHOLD_MS, logs the loop thread's stack so the blocking
+call can be found.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from bot.config import LOOP_LAG_THRESHOLD_MS
+
+logger = logging.getLogger(__name__)
+
+_INTERVAL = 0.1
+# Roughly the last minute of samples at the default interval
+_SAMPLES = 600
+
+
+class LoopMonitor:
+    def __init__(self, threshold_ms: int) -> None:
+        self._threshold = threshold_ms / 1000
+        self._lags: deque[float] = deque(maxlen=_SAMPLES)
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._task: asyncio.Task | None = None
+        self._stop = threading.Event()
+        self.stalls = 0
+
+    def start(self) -> None:
+        """Start sampling; must be called from inside the running loop."""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._sample())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        logger.info(f"Event loop monitor started (threshold={self._threshold * 1000:.0f} ms).")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _sample(self) -> None:
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(_INTERVAL)
+            now = time.monotonic()
+            self._lags.append(max(0.0, now - before - _INTERVAL))
+            self._heartbeat = now
+
+    def _watch(self) -> None:
+        # Heartbeat of the stall already reported, so each stall is logged once
+        reported = 0.0
+        while not self._stop.wait(self._threshold / 2):
+            beat = self._heartbeat
+            stalled = time.monotonic() - beat - _INTERVAL
+            if stalled <= self._threshold or beat == reported:
+                continue
+            reported = beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<unavailable>\n"
+            logger.warning(f"Event loop blocked for {stalled * 1000:.0f} ms. Loop thread stack:\n{stack}")
+
+    def percentile(self, pct: float) -> float:
+        """Loop lag in seconds at the given percentile of recent samples."""
+        lags = sorted(self._lags)
+        if not lags:
+            return 0.0
+        return lags[min(len(lags) - 1, int(len(lags) * pct / 100))]
+
+
+# Singleton instance shared across the bot
+loop_monitor = LoopMonitor(LOOP_LAG_THRESHOLD_MS)
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import sys
 import time
@@ -5,7 +6,10 @@ from telegram import BotCommand
 from telegram.ext import ApplicationBuilder
 
 from bot.config import BOT_TOKEN
-from bot.handlers import get_handlers
+from bot.handlers import get_handlers, resume_job, abandon_job
+from bot.journal import journal
+from bot.loop_monitor import loop_monitor
+from bot import transport
 
 # ── Logging setup ──
 logging.basicConfig(
@@ -19,9 +23,26 @@ logging.getLogger("telegram").setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 
+# Hands recovered jobs to PTB once it is running (see _launch_recovered_jobs)
+_recovery_launcher: asyncio.Task | None = None
+
+
+async def _launch_recovered_jobs(application, resumable: list, abandoned: list) -> None:
+    """
+    Start recovered jobs through application.create_task so stop() awaits them
+    exactly like new download callbacks. post_init runs before start(), and PTB
+    only tracks tasks created while the application is running.
+    """
+    while not application.running:
+        await asyncio.sleep(0.1)
+    for job in abandoned:
+        application.create_task(abandon_job(application.bot, job))
+    for job in resumable:
+        application.create_task(resume_job(application.bot, job))
+
 
 async def post_init(application) -> None:
-    """Set bot commands on startup."""
+    """Set bot commands and resume interrupted jobs on startup."""
     commands = [
         BotCommand("start", "Start the bot & welcome message"),
         BotCommand("id", "Get your Telegram User ID"),
@@ -32,11 +53,27 @@ async def post_init(application) -> None:
     await application.bot.set_my_commands(commands)
     logger.info("✅ Bot commands registered.")
 
+    loop_monitor.start()
+
+    # Replay jobs interrupted by the last shutdown or crash
+    global _recovery_launcher
+    resumable, abandoned = await asyncio.to_thread(journal.recover)
+    if resumable or abandoned:
+        _recovery_launcher = asyncio.create_task(_launch_recovered_jobs(application, resumable, abandoned))
+
+
+async def post_shutdown(application) -> None:
+    """Stop background monitors on shutdown."""
+    loop_monitor.stop()
+
 
 def main() -> None:
     """Initialize and start the Telegram bot."""
     logger.info("🚀 Starting Video Downloader Bot...")
 
+    # Shared DNS cache + keep-alive pool for all download jobs
+    transport.install()
+
     # Build the application
     app = (
         ApplicationBuilder()
@@ -44,6 +81,7 @@ def main() -> None:
         .read_timeout(120)
         .write_timeout(120)
         .post_init(post_init)
+        .post_shutdown(post_shutdown)
         .build()
     )
 
@@ -3,10 +3,52 @@ In-memory statistics tracker for the bot.
 Reset on each restart — no persistence needed for now.
 """
 import time
-from collections import defaultdict
+from collections import defaultdict, deque
 from dataclasses import dataclass, field
 from threading import Lock
 
+# How many finished jobs keep their stage timings for /timings
+_RECENT_JOBS_KEPT = 500
+
+
+class StageTimer:
+    """
+    Splits one job's wall time into named stages. Time is always charged to
+    the stage currently running, so a job that fails mid-download shows the
+    time under "download".
+    """
+
+    def __init__(self, stage: str) -> None:
+        self._last = time.monotonic()
+        self.stage: str | None = stage
+        self.stages: dict[str, float] = {}
+
+    def enter(self, stage: str | None) -> None:
+        """Close the running stage and start the next one (None to stop)."""
+        now = time.monotonic()
+        if self.stage is not None:
+            self.stages[self.stage] = self.stages.get(self.stage, 0.0) + now - self._last
+        self.stage = stage
+        self._last = now
+
+
+@dataclass
+class JobTiming:
+    finished_at: float
+    platform: str
+    audio_only: bool
+    outcome: str
+    # stage name -> seconds, in the order the stages ran
+    stages: dict[str, float]
+
+
+def _format_timing(job: JobTiming) -> str:
+    icon = "🎵" if job.audio_only else "🎬"
+    clock = time.strftime("%H:%M:%S", time.localtime(job.finished_at))
+    stages = " · ".join(f"{name} {secs:.1f}s" for name, secs in job.stages.items())
+    total = sum(job.stages.values())
+    return f"<code>{clock}</code> {icon} {job.outcome}: {stages} · <b>total {total:.1f}s</b>"
+
 
 @dataclass
 class BotStats:
@@ -15,6 +57,14 @@ class BotStats:
     total_succeeded: int = 0
     total_failed: int = 0
     total_too_large: int = 0
+    total_fitted: int = 0
+    total_rejected: int = 0
+
+    # Shared transport (see bot.transport)
+    http_requests: int = 0
+    http_connections: int = 0
+    dns_hits: int = 0
+    dns_misses: int = 0
 
     # platform_name -> count
     by_platform: dict[str, int] = field(default_factory=lambda: defaultdict(int))
@@ -22,31 +72,60 @@ class BotStats:
     by_user: dict[int, int] = field(default_factory=lambda: defaultdict(int))
     # Unique users seen
     all_users: set[int] = field(default_factory=set)
+    # Stage timings of the most recent jobs, oldest first
+    recent_jobs: deque[JobTiming] = field(default_factory=lambda: deque(maxlen=_RECENT_JOBS_KEPT))
 
+    # Only taken by the transport counters, which are bumped from worker threads.
+    # Everything else is recorded from the event loop and needs no lock.
     _lock: Lock = field(default_factory=Lock, repr=False, compare=False)
 
     def record_user(self, user_id: int) -> None:
-        with self._lock:
-            self.all_users.add(user_id)
+        self.all_users.add(user_id)
 
     def record_attempt(self) -> None:
-        with self._lock:
-            self.total_attempted += 1
+        self.total_attempted += 1
 
     def record_success(self, platform: str, user_id: int) -> None:
-        with self._lock:
-            self.total_succeeded += 1
-            self.by_platform[platform] += 1
-            self.by_user[user_id] += 1
+        self.total_succeeded += 1
+        self.by_platform[platform] += 1
+        self.by_user[user_id] += 1
 
     def record_failure(self) -> None:
-        with self._lock:
-            self.total_failed += 1
+        self.total_failed += 1
 
     def record_too_large(self) -> None:
+        self.total_too_large += 1
+        self.total_failed += 1
+
+    def record_fitted(self) -> None:
+        self.total_fitted += 1
+
+    def record_rejected(self) -> None:
+        self.total_rejected += 1
+
+    def record_job(self, platform: str, audio_only: bool, outcome: str, stages: dict[str, float]) -> None:
+        self.recent_jobs.append(JobTiming(time.time(), platform, audio_only, outcome, dict(stages)))
+
+    def record_http_request(self) -> None:
         with self._lock:
-            self.total_too_large += 1
-            self.total_failed += 1
+            self.http_requests += 1
+
+    def record_http_connection(self) -> None:
+        with self._lock:
+            self.http_connections += 1
+
+    def record_dns_lookup(self, cached: bool) -> None:
+        with self._lock:
+            if cached:
+                self.dns_hits += 1
+            else:
+                self.dns_misses += 1
+
+    def connection_reuse_rate(self) -> float:
+        """Share of HTTP requests served on an already-open connection."""
+        if not self.http_requests:
+            return 0.0
+        return max(0.0, 1 - self.http_connections / self.http_requests)
 
     def uptime_str(self) -> str:
         elapsed = int(time.time() - self.started_at)
@@ -57,6 +136,14 @@ class BotStats:
     def top_platforms(self, n: int = 5) -> list[tuple[str, int]]:
         return sorted(self.by_platform.items(), key=lambda x: x[1], reverse=True)[:n]
 
+    def timings_text(self, platform: str, n: int = 10) -> str:
+        jobs = [j for j in self.recent_jobs if j.platform == platform][-n:]
+        if not jobs:
+            return f"⏱ No recent jobs for <b>{platform}</b>."
+        lines = [f"⏱ <b>Last {len(jobs)} {platform} job(s)</b>\n"]
+        lines.extend(_format_timing(j) for j in reversed(jobs))
+        return "\n".join(lines)
+
     def summary_text(self) -> str:
         lines = [
             "📊 <b>Bot Statistics</b>\n",
@@ -66,12 +153,21 @@ class BotStats:
             f"✅ Succeeded: <b>{self.total_succeeded}</b>",
             f"❌ Failed: <b>{self.total_failed}</b>",
             f"📦 Too large: <b>{self.total_too_large}</b>",
+            f"🗜 Compressed to fit: <b>{self.total_fitted}</b>",
+            f"🚦 Rejected (load shed): <b>{self.total_rejected}</b>",
         ]
         top = self.top_platforms()
         if top:
             lines.append("\n🏆 <b>Top platforms:</b>")
             for platform, count in top:
                 lines.append(f"  • {platform}: {count}")
+        if self.http_requests or self.dns_hits or self.dns_misses:
+            lines.append("\n🔌 <b>Transport:</b>")
+            lines.append(
+                f"  • Connections: {self.http_connections} for {self.http_requests} requests "
+                f"({self.connection_reuse_rate():.0%} reused)"
+            )
+            lines.append(f"  • DNS cache (downloads): {self.dns_hits} hits / {self.dns_misses} lookups")
         return "\n".join(lines)
 
 
@@ -0,0 +1,174 @@
+"""
+Process-wide network transport shared by every yt-dlp job.
+
+Each download builds its own YoutubeDL, and with it a fresh HTTP session.
+This module keeps the expensive parts alive between jobs instead:
+
+- a TTL cache in front of socket.getaddrinfo, so the same CDN hostnames
+  are not resolved again for every job. It only applies inside
+  downloader_scope(), so the Telegram client's own lookups bypass it and
+  the DNS numbers in /stats stay about downloads;
+- a yt-dlp request handler that plugs each job's session into one shared
+  keep-alive connection pool per host, so established TLS connections are
+  reused rather than renegotiated.
+
+Call install() once at startup. Everything here is thread-safe, since
+downloads run in worker threads.
+"""
+import logging
+import socket
+import time
+from contextlib import contextmanager
+from threading import Lock, local
+from typing import Any
+
+from bot.config import DNS_CACHE_TTL, HTTP_POOL_HOSTS, HTTP_POOL_SIZE
+from bot.stats import stats
+
+logger = logging.getLogger(__name__)
+
+# Hard cap on cached DNS answers, expired entries are purged past this size
+_DNS_MAX_ENTRIES = 1024
+
+_installed = False
+_install_lock = Lock()
+
+# Set on worker threads while they run a yt-dlp job
+_scope = local()
+
+
+@contextmanager
+def downloader_scope():
+    """Route this thread's DNS lookups through the cache for the duration."""
+    prev = getattr(_scope, "active", False)
+    _scope.active = True
+    try:
+        yield
+    finally:
+        _scope.active = prev
+
+
+class _DNSCache:
+    """Thread-safe TTL cache wrapping a getaddrinfo-compatible resolver."""
+
+    def __init__(self, ttl: float, resolver) -> None:
+        self._ttl = ttl
+        self._resolve = resolver
+        self._entries: dict[tuple, tuple[float, list]] = {}
+        self._lock = Lock()
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        if not getattr(_scope, "active", False):
+            return self._resolve(host, port, family, type, proto, flags)
+
+        key = (host, port, family, type, proto, flags)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and entry[0] > now:
+            stats.record_dns_lookup(cached=True)
+            return list(entry[1])
+
+        # Resolve outside the lock so a slow lookup never blocks other hosts
+        result = self._resolve(host, port, family, type, proto, flags)
+        stats.record_dns_lookup(cached=False)
+        with self._lock:
+            if len(self._entries) >= _DNS_MAX_ENTRIES:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+                if len(self._entries) >= _DNS_MAX_ENTRIES:
+                    self._entries.clear()
+            self._entries[key] = (now + self._ttl, list(result))
+        return result
+
+
+def _install_dns_cache() -> None:
+    if DNS_CACHE_TTL <= 0:
+        logger.info("DNS cache disabled (DNS_CACHE_TTL=0).")
+        return
+    cache = _DNSCache(DNS_CACHE_TTL, socket.getaddrinfo)
+    socket.getaddrinfo = cache.getaddrinfo
+    logger.info(f"DNS cache enabled (ttl={DNS_CACHE_TTL}s).")
+
+
+def _install_connection_pool() -> None:
+    """Register a yt-dlp request handler backed by shared keep-alive pools."""
+    try:
+        import requests
+        from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+        from yt_dlp.networking._requests import RequestsRH
+        from yt_dlp.networking.common import register_preference, register_rh
+    except ImportError as e:
+        logger.warning(f"Connection pooling unavailable, using yt-dlp defaults: {e}")
+        return
+
+    class _CountingHTTPPool(HTTPConnectionPool):
+        def _new_conn(self):
+            stats.record_http_connection()
+            return super()._new_conn()
+
+    class _CountingHTTPSPool(HTTPSConnectionPool):
+        def _new_conn(self):
+            stats.record_http_connection()
+            return super()._new_conn()
+
+    class _SharedAdapter(requests.adapters.BaseAdapter):
+        """Adapter handed to every session; survives the sessions closing it."""
+
+        def __init__(self, adapter: requests.adapters.HTTPAdapter) -> None:
+            super().__init__()
+            adapter.init_poolmanager(HTTP_POOL_HOSTS, HTTP_POOL_SIZE)
+            adapter.poolmanager.pool_classes_by_scheme = {
+                "http": _CountingHTTPPool,
+                "https": _CountingHTTPSPool,
+            }
+            self._adapter = adapter
+
+        def send(self, request, **kwargs):
+            stats.record_http_request()
+            return self._adapter.send(request, **kwargs)
+
+        def close(self) -> None:
+            # Owned by the process, not by whichever job happened to create it
+            pass
+
+    adapters: dict[tuple, _SharedAdapter] = {}
+    adapters_lock = Lock()
+
+    @register_rh
+    class PooledRequestsRH(RequestsRH):
+        RH_NAME = "requests-pooled"
+
+        def _create_instance(self, *args: Any, **kwargs: Any):
+            session = super()._create_instance(*args, **kwargs)
+            # Connections can only be shared between jobs with identical TLS settings
+            key = (
+                getattr(self, "verify", True),
+                getattr(self, "source_address", None),
+                getattr(self, "prefer_system_certs", False),
+                repr(getattr(self, "_client_cert", None)),
+                kwargs.get("legacy_ssl_support"),
+            )
+            with adapters_lock:
+                shared = adapters.get(key)
+                if shared is None:
+                    shared = adapters[key] = _SharedAdapter(session.get_adapter("https://"))
+            session.mount("https://", shared)
+            session.mount("http://", shared)
+            return session
+
+    @register_preference(PooledRequestsRH)
+    def _prefer_pooled(rh, request) -> int:
+        return 500
+
+    logger.info(f"HTTP connection pool enabled ({HTTP_POOL_HOSTS} hosts x {HTTP_POOL_SIZE} connections).")
+
+
+def install() -> None:
+    """Install the shared DNS cache and connection pool (idempotent)."""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        _install_dns_cache()
+        _install_connection_pool()
+        _installed = True